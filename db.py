@@ -1,24 +1,41 @@
 from __future__ import annotations
 
-import os, urllib.parse as up, ssl, pg8000.native as pg
+import os, urllib.parse as up, ssl, threading, queue, functools, time, pg8000.native as pg
+from collections import OrderedDict
+from contextlib import contextmanager
 import certifi
 from dotenv import load_dotenv
 
 # Load ..env when run from scripts/tests
 load_dotenv()
 
-_conn: pg.Connection | None = None
+# Pool sizing (tunable via .env)
+POOL_MIN       = int(os.getenv("DB_POOL_MIN", "2"))          # connections opened up front by warm()
+POOL_MAX       = int(os.getenv("DB_POOL_MAX", "16"))         # max open connections per process
+STMT_CACHE_MAX = int(os.getenv("DB_STMT_CACHE_SIZE", "64"))  # prepared statements kept per connection
+IDLE_CHECK_SECS = float(os.getenv("DB_IDLE_CHECK_SECS", "30"))  # ping connections idle longer than this on checkout
+
+_IDLE = b"I"  # pg8000 transaction status when no transaction is open
+
+# SQLSTATEs meaning the prepared statement itself is unusable (vs. a data error like 23505):
+# 0A000 "cached plan must not change result type" after a schema change, 26000 statement gone
+_STALE_STMT = frozenset({"0A000", "26000"})
 
-def _parse_db_url(db_url: str) -> dict:
-    u = up.urlparse(db_url)
-    if u.scheme not in ("postgres", "postgresql"):
-        raise ValueError("DATABASE_URL must start with postgresql://")
 
+def sqlstate(e: Exception) -> str | None:
+    """SQLSTATE code of a pg8000 DatabaseError (e.g. '23505'), or None for other exceptions."""
+    if isinstance(e, pg.DatabaseError) and e.args and isinstance(e.args[0], dict):
+        return e.args[0].get("C")
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _ssl_ctx(ca_bundle: str | None, insecure: bool) -> ssl.SSLContext:
+    """Build the SSLContext once per process; parsing CA bundles is the slow part of connecting."""
     # Base trust store from certifi
     ssl_ctx = ssl.create_default_context(cafile=certifi.where())
 
     # Optionally add AWS RDS bundle (recommended)
-    ca_bundle = os.getenv("RDS_CA_BUNDLE")
     if ca_bundle and os.path.exists(ca_bundle):
         try:
             ssl_ctx.load_verify_locations(cafile=ca_bundle)
@@ -26,11 +43,23 @@ def _parse_db_url(db_url: str) -> dict:
             print(f"[db] Warning: couldn't load RDS_CA_BUNDLE ({ca_bundle}): {e}")
 
     # Optional dev override (only if you absolutely must)
-    if os.getenv("ALLOW_INSECURE_SSL", "").lower() in ("1", "true", "yes"):
+    if insecure:
         print("[db] WARNING: ALLOW_INSECURE_SSL is enabled (dev only).")
         ssl_ctx.check_hostname = False
         ssl_ctx.verify_mode = ssl.CERT_NONE
 
+    return ssl_ctx
+
+def _parse_db_url(db_url: str) -> dict:
+    u = up.urlparse(db_url)
+    if u.scheme not in ("postgres", "postgresql"):
+        raise ValueError("DATABASE_URL must start with postgresql://")
+
+    ssl_ctx = _ssl_ctx(
+        os.getenv("RDS_CA_BUNDLE"),
+        os.getenv("ALLOW_INSECURE_SSL", "").lower() in ("1", "true", "yes"),
+    )
+
     return dict(
         user=up.unquote(u.username or ""),
         password=up.unquote(u.password or ""),
@@ -40,16 +69,206 @@ def _parse_db_url(db_url: str) -> dict:
         ssl_context=ssl_ctx,
     )
 
-def db() -> pg.Connection:
-    global _conn
+
+class PooledConnection:
+    """
+    A pg8000 connection plus an LRU of server-side prepared statements keyed by SQL text.
+    Parameterized SQL is parsed/planned by Postgres once per connection and re-executed
+    with Bind/Execute afterwards. Parameterless SQL goes through the simple query protocol
+    so multi-statement scripts (db.sql) keep working.
+    """
+
+    def __init__(self, conn: pg.Connection):
+        self.conn = conn
+        self._stmts: OrderedDict[str, pg.PreparedStatement] = OrderedDict()
+        self._settings: dict[str, str | None] = {}  # session GUCs applied so far (None = unsupported)
+        self.last_used = time.monotonic()
+
+    def run(self, sql: str, **params):
+        if not params:
+            return self.conn.run(sql)
+        ps = self._stmts.get(sql)
+        if ps is None:
+            ps = self.conn.prepare(sql)
+            self._stmts[sql] = ps
+            if len(self._stmts) > STMT_CACHE_MAX:
+                _, old = self._stmts.popitem(last=False)
+                self._close_stmt(old)
+        else:
+            self._stmts.move_to_end(sql)
+        try:
+            return ps.run(**params)
+        except pg.DatabaseError as e:
+            # Constraint violations etc. leave the statement valid: keep it cached.
+            # Only a stale statement is evicted, and closed so it doesn't linger server-side.
+            if sqlstate(e) in _STALE_STMT:
+                self._stmts.pop(sql, None)
+                self._close_stmt(ps)
+            raise
+
+    @staticmethod
+    def _close_stmt(ps: pg.PreparedStatement) -> None:
+        try:
+            ps.close()
+        except Exception:
+            pass
+
+    def apply_settings(self, settings: dict) -> None:
+        """
+        Set session-level GUCs, skipping ones this connection already has; all changed ones
+        go in a single set_config SELECT, so steady-state cost is zero round-trips and a change
+        costs one. GUCs the server doesn't know (e.g. older pgvector) are remembered and skipped.
+        """
+        changed = []
+        for name, value in settings.items():
+            value = str(value)
+            current = self._settings.get(name, "")
+            if current is not None and current != value:
+                changed.append((name, value))
+        if not changed:
+            return
+        sql = "SELECT " + ", ".join(f"set_config(:n{i}, :v{i}, false)" for i in range(len(changed)))
+        params = {}
+        for i, (name, value) in enumerate(changed):
+            params[f"n{i}"], params[f"v{i}"] = name, value
+        try:
+            self.run(sql, **params)
+        except pg.DatabaseError:
+            if len(changed) == 1:
+                name, value = changed[0]
+                print(f"[db] Warning: skipping unsupported setting {name}={value}")
+                self._settings[name] = None
+                return
+            # Find the unsupported one(s); the rest get applied individually
+            for name, value in changed:
+                self.apply_settings({name: value})
+            return
+        for name, value in changed:
+            self._settings[name] = value
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class Pool:
+    """
+    Thread-safe pool of pg8000 connections (pg8000 connections are not thread-safe).
+    Connections are opened lazily up to max_size; callers block when all are checked out.
+    """
+
+    def __init__(self, db_url: str, max_size: int = POOL_MAX):
+        self._db_url = db_url
+        self._idle: queue.LifoQueue[PooledConnection] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self) -> PooledConnection:
+        return PooledConnection(pg.Connection(**_parse_db_url(self._db_url)))
+
+    def _checkout(self) -> PooledConnection:
+        """
+        An idle connection, or a new one. Connections idle longer than IDLE_CHECK_SECS get a
+        SELECT 1 first: if the server closed them meanwhile (RDS idle timeout, failover, restart)
+        that fails before any real statement was sent, so switching to a fresh one is safe.
+        """
+        try:
+            pc = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        if time.monotonic() - pc.last_used > IDLE_CHECK_SECS:
+            try:
+                pc.conn.run("SELECT 1")
+            except (pg.InterfaceError, pg.DatabaseError, OSError):
+                # Other idle connections were likely cut by the same event: drop them too
+                pc.close()
+                self._discard_idle()
+                return self._connect()
+        return pc
+
+    def _checkin(self, pc: PooledConnection) -> None:
+        pc.last_used = time.monotonic()
+        self._idle.put(pc)
+
+    @contextmanager
+    def connection(self):
+        """Check out one connection (use for several statements that must share a session)."""
+        self._slots.acquire()
+        try:
+            pc = self._checkout()
+            try:
+                yield pc
+            except (pg.InterfaceError, OSError):
+                # Socket-level failure: drop the connection. Idle ones were likely cut by the
+                # same event (RDS idle timeout, failover, restart), so drop those too and let
+                # the next checkout open a fresh connection.
+                pc.close()
+                self._discard_idle()
+                raise
+            except Exception:
+                if pc.conn._transaction_status != _IDLE:
+                    try:
+                        pc.conn.run("ROLLBACK")
+                    except Exception:
+                        pc.close()
+                        raise
+                self._checkin(pc)
+                raise
+            else:
+                self._checkin(pc)
+        finally:
+            self._slots.release()
+
+    def _discard_idle(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def run(self, sql: str, **params):
+        # No retry on a socket error: the server may have executed (and committed) the
+        # statement before the connection dropped, and re-running a write would repeat it.
+        # Stale idle connections are caught before use instead (see _checkout).
+        with self.connection() as pc:
+            return pc.run(sql, **params)
+
+    def run_with_settings(self, sql: str, settings: dict, **params):
+        """
+        Like run(), but first applies session settings (see PooledConnection.apply_settings),
+        e.g. the hnsw.* GUCs for retrieval. sql still goes through the statement cache.
+        sql must be read-only: it is retried once on a fresh connection after a socket error.
+        """
+        for attempt in range(2):
+            try:
+                with self.connection() as pc:
+                    pc.apply_settings(settings)
+                    return pc.run(sql, **params)
+            except (pg.InterfaceError, OSError):
+                # the failure emptied the idle queue, so the retry opens a fresh connection
+                if attempt:
+                    raise
+
+    def warm(self, n: int = POOL_MIN) -> None:
+        """Open up to n idle connections now so the first requests don't pay TCP+TLS+auth."""
+        for _ in range(max(0, n - self._idle.qsize())):
+            self._checkin(self._connect())
+
+    def close(self):
+        self._discard_idle()
+
+
+_pool: Pool | None = None
+_pool_lock = threading.Lock()
+
+def db() -> Pool:
+    global _pool
     db_url = os.environ.get("DATABASE_URL")
     if not db_url:
         raise RuntimeError("DATABASE_URL not set in environment")
-    if _conn is None:
-        _conn = pg.Connection(**_parse_db_url(db_url))
-    else:
-        try:
-            _conn.run("SELECT 1")
-        except Exception:
-            _conn = pg.Connection(**_parse_db_url(db_url))
-    return _conn
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = Pool(db_url)
+    return _pool
@@ -49,8 +49,15 @@ CREATE UNIQUE INDEX IF NOT EXISTS uq_conv_windows_span
 CREATE INDEX IF NOT EXISTS idx_conv_windows_user_conv
   ON conv_windows (user_id, conversation_id, last_turn_at DESC);
 
-CREATE INDEX IF NOT EXISTS idx_conv_windows_emb_ivf
-  ON conv_windows USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+-- ANN index for `ORDER BY embedding <=> :qv::vector` (cosine). HNSW replaces the old
+-- ivfflat index: better recall/latency and no need to rebuild once data grows.
+DROP INDEX IF EXISTS idx_conv_windows_emb_ivf;
+SET maintenance_work_mem = '2GB';
+SET max_parallel_maintenance_workers = 7;
+CREATE INDEX IF NOT EXISTS conv_windows_embedding_hnsw
+  ON conv_windows USING hnsw (embedding vector_cosine_ops) WITH (m = 24, ef_construction = 128);
+RESET maintenance_work_mem;
+RESET max_parallel_maintenance_workers;
 
 CREATE INDEX IF NOT EXISTS idx_conv_windows_fts_gin
   ON conv_windows USING GIN (fts);
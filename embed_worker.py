@@ -1,100 +1,138 @@
 # embed_worker.py
 from __future__ import annotations
+import asyncio
 import os
-import time
-from typing import List, Tuple
+from typing import List, Sequence, Tuple
 
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 # Load ..env so OPENAI_API_KEY / DATABASE_URL are available when running directly
 load_dotenv()
 
 # Flat imports because your files are in the project root
 from db import db
-from rag_core import to_pgvector
+from rag_core import OPENAI_HTTP_TIMEOUT, VEC_TYPE, to_pgvectors
 
 # ---------------- Config ----------------
 EMBED_MODEL  = os.getenv("EMBED_MODEL", "text-embedding-3-small")
 BATCH_SIZE   = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+CONCURRENCY  = int(os.getenv("EMBED_CONCURRENCY", "4"))       # embedding batches in flight at once
 SLEEP_EMPTY  = float(os.getenv("WORKER_SLEEP_EMPTY", "2.0"))   # seconds between polls when no work
 SLEEP_ERROR  = float(os.getenv("WORKER_SLEEP_ERROR", "5.0"))   # cool-off after API/DB errors
 # ----------------------------------------
 
-client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+# Async client over one HTTP/2 connection pool: concurrent batches multiplex on kept-alive sockets
+client = AsyncOpenAI(
+    api_key=os.environ["OPENAI_API_KEY"],
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+        timeout=OPENAI_HTTP_TIMEOUT,
+    ),
+)
 
 
-def fetch_pending(limit: int) -> List[Tuple[str, str]]:
+def fetch_pending(limit: int, exclude: Sequence[str] = ()) -> List[Tuple[str, str]]:
     """
-    Return list of (window_id, text) for rows needing embeddings.
+    Return list of (window_id, text) for rows needing embeddings,
+    skipping window_ids that are already in flight.
     """
     sql = """
     SELECT window_id, text
     FROM conv_windows
     WHERE embedding IS NULL
+      AND NOT (window_id = ANY(:ex::uuid[]))
     ORDER BY created_at
     LIMIT :lim;
     """
-    rows = db().run(sql, lim=limit)  # pass kwargs, not a dict
+    rows = db().run(sql, lim=limit, ex=list(exclude))  # pass kwargs, not a dict
     return [(str(r[0]), r[1]) for r in rows]
 
 
-def update_embedding(window_id: str, vec: List[float]) -> None:
+def update_embeddings(window_ids: Sequence[str], vecs: Sequence[List[float]]) -> None:
     """
-    Update a single row with the computed vector.
+    Update many rows with their computed vectors in one statement.
     """
-    sql = """
-    UPDATE conv_windows
-    SET embedding = :v::vector
-    WHERE window_id = :wid;
+    sql = f"""
+    UPDATE conv_windows AS w
+    SET embedding = t.v::{VEC_TYPE}
+    FROM unnest(:wids::uuid[], :vecs::text[]) AS t(wid, v)
+    WHERE w.window_id = t.wid;
     """
-    db().run(sql, v=to_pgvector(vec), wid=window_id)  # kwargs
+    db().run(sql, wids=list(window_ids), vecs=to_pgvectors(vecs))  # kwargs
 
 
-def embed_batch(texts: List[str]) -> List[List[float]]:
+async def embed_batch(texts: List[str]) -> List[List[float]]:
     """
     Call OpenAI Embeddings once with a batch of inputs.
     """
-    resp = client.embeddings.create(model=EMBED_MODEL, input=texts)
+    resp = await client.embeddings.create(model=EMBED_MODEL, input=texts)
     return [d.embedding for d in resp.data]
 
 
-def main() -> None:
-    print(f"[worker] starting — model={EMBED_MODEL}, batch_size={BATCH_SIZE}")
+async def embed_and_store(chunk: List[Tuple[str, str]], sem: asyncio.Semaphore) -> int:
+    """
+    Embed one chunk and write it back; returns the number of rows updated.
+    DB calls are blocking (pg8000), so they run in a thread.
+    """
+    ids, texts = zip(*chunk)  # type: ignore
+    async with sem:
+        try:
+            embs = await embed_batch(list(texts))
+            await asyncio.to_thread(update_embeddings, ids, embs)
+            return len(ids)
+        except Exception as e:
+            # Batch failed: back off to per-row (rate limits, rare content issues, etc.)
+            print(f"[worker] batch error: {e}. Falling back to per-row.")
+            done = 0
+            for wid, txt in chunk:
+                try:
+                    vec = (await embed_batch([txt]))[0]
+                    await asyncio.to_thread(update_embeddings, [wid], [vec])
+                    done += 1
+                except Exception as ee:
+                    # Skip problematic row; log and continue
+                    print(f"[worker] row error window_id={wid}: {ee}")
+                    await asyncio.sleep(0.25)
+            await asyncio.sleep(1.0)
+            return done
+
+
+async def run() -> None:
+    sem = asyncio.Semaphore(CONCURRENCY)  # respect RPM limits: at most CONCURRENCY requests in flight
+    pending: List[Tuple[str, str]] = []
     while True:
         try:
-            pending = fetch_pending(BATCH_SIZE)
             if not pending:
-                time.sleep(SLEEP_EMPTY)
+                pending = await asyncio.to_thread(fetch_pending, BATCH_SIZE * CONCURRENCY)
+            if not pending:
+                await asyncio.sleep(SLEEP_EMPTY)
                 continue
 
-            ids, texts = zip(*pending)  # type: ignore
-
-            # Try batch first
-            try:
-                embs = embed_batch(list(texts))
-                for wid, vec in zip(ids, embs):
-                    update_embedding(wid, vec)
-                print(f"[worker] embedded {len(ids)} window(s)")
-            except Exception as e:
-                # Batch failed: back off to per-row (rate limits, rare content issues, etc.)
-                print(f"[worker] batch error: {e}. Falling back to per-row.")
-                for wid, txt in pending:
-                    try:
-                        vec = embed_batch([txt])[0]
-                        update_embedding(wid, vec)
-                    except Exception as ee:
-                        # Skip problematic row; log and continue
-                        print(f"[worker] row error window_id={wid}: {ee}")
-                        time.sleep(0.25)
-                time.sleep(1.0)
-
-        except KeyboardInterrupt:
-            print("[worker] interrupted — exiting.")
-            break
+            chunks = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+            # Prefetch the next round while embeddings are in flight
+            prefetch = asyncio.create_task(asyncio.to_thread(
+                fetch_pending, BATCH_SIZE * CONCURRENCY, [wid for wid, _ in pending]
+            ))
+            for n in await asyncio.gather(*(embed_and_store(c, sem) for c in chunks)):
+                if n:
+                    print(f"[worker] embedded {n} window(s)")
+            pending = await prefetch
+
         except Exception as e:
             print(f"[worker] unexpected error: {e}")
-            time.sleep(SLEEP_ERROR)
+            pending = []
+            await asyncio.sleep(SLEEP_ERROR)
+
+
+def main() -> None:
+    print(f"[worker] starting — model={EMBED_MODEL}, batch_size={BATCH_SIZE}, concurrency={CONCURRENCY}")
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("[worker] interrupted — exiting.")
 
 
 if __name__ == "__main__":
@@ -1,148 +1,350 @@
 # main.py
 from __future__ import annotations
-from typing import Dict, Any, List
-import hashlib
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Iterator, List, Tuple
 from uuid import uuid4
+import json
+import queue
+import random
+import threading
+import time
 
 from fastapi import FastAPI, HTTPException, Body, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from models import IngestRequest, AskRequest, AskResponse, Snippet
+from models import IngestRequest, AskRequest, AskResponse
 from windowing import (
+    SEP,
     extract_turn_texts,
     extract_turn_times,
-    build_windows,
-    window_time_bounds,
     tail_windows_for_new_turn,
+    window_hashes,
 )
-from db import db
+from db import db, sqlstate
 from rag_core import (
-    embed_text,
-    to_pgvector,
+    embed_pgvector,
     retrieve_windows_vector,
     retrieve_windows_hybrid,
     build_prompt,
     chat,
+    chat_stream,
 )
 
-app = FastAPI(title="RDS pgvector RAG (row-per-window)", version="0.4.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open pooled DB connections at startup instead of on the first requests
+    try:
+        db().warm()
+    except Exception as e:
+        print(f"[main] Warning: couldn't warm DB pool: {e}")
+    _start_event_writer()
+    yield
+    # Flush queued analytics while the pool is still open, then close it
+    _stop_event_writer()
+    try:
+        db().close()
+    except Exception:
+        pass
+
+
+app = FastAPI(title="RDS pgvector RAG (row-per-window)", version="0.4.0", lifespan=lifespan)
 
 
 # ---------- helpers ----------
-def _ensure_user(user_id: str):
+# user_ids this process has already upserted; skips a no-op INSERT round-trip per request
+_known_users: set = set()
+_known_users_lock = threading.Lock()
+
+
+def _ensure_user(user_id: str, force: bool = False):
+    if not force:
+        with _known_users_lock:
+            if user_id in _known_users:
+                return
     sql = """
     INSERT INTO users (user_id) VALUES (:uid)
     ON CONFLICT (user_id) DO NOTHING;
     """
     db().run(sql, uid=user_id)
+    with _known_users_lock:
+        _known_users.add(user_id)
 
 
-def _sha256_norm(text: str) -> str:
-    t = " ".join((text or "").split())
-    return hashlib.sha256(t.encode("utf-8")).hexdigest()
-
-
-def _normalize_hits(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Cast DB-native types to JSON-friendly ones (UUID->str, Decimal->float)."""
-    out: List[Dict[str, Any]] = []
-    for h in (hits or []):
-        d = dict(h)
-        wid = d.get("window_id")
-        if wid is not None and not isinstance(wid, str):
-            d["window_id"] = str(wid)
-        sc = d.get("score")
-        if sc is not None and not isinstance(sc, (int, float)):
-            try:
-                d["score"] = float(sc)
-            except Exception:
-                d["score"] = None
-        out.append(d)
-    return out
+def _is_missing_user(e: Exception) -> bool:
+    """FK violation (23503): the user was deleted out-of-band (delete_user.py) after we cached it."""
+    return sqlstate(e) == "23503"
 
 
-def _insert_window_row(row: Dict[str, Any]):
+def _insert_window_rows(rows: List[Dict[str, Any]]):
+    """Insert many windows in one round-trip (parallel arrays unnested server-side)."""
+    if not rows:
+        return
     sql = """
     INSERT INTO conv_windows
       (user_id, conversation_id, start_index, end_index, turn_count,
        text, test_group, first_turn_at, last_turn_at, text_hash)
-    VALUES
-      (:uid, :cid, :si, :ei, :tc,
-       :txt, :tg, :fta, :lta, :th)
+    SELECT :uid, :cid, t.si, t.ei, t.tc, t.txt, :tg::int, t.fta, t.lta, t.th
+    FROM unnest(:si::int[], :ei::int[], :tc::int[], :txt::text[],
+                :fta::timestamptz[], :lta::timestamptz[], :th::text[])
+         AS t(si, ei, tc, txt, fta, lta, th)
     ON CONFLICT (user_id, conversation_id, start_index, end_index) DO NOTHING;
     """
     db().run(
         sql,
-        uid=row["user_id"],
-        cid=row["conversation_id"],
-        si=row["start_index"],
-        ei=row["end_index"],
-        tc=row["turn_count"],
-        txt=row["text"],
-        tg=row["test_group"],
-        fta=row["first_turn_at"],
-        lta=row["last_turn_at"],
-        th=row["text_hash"],
+        uid=rows[0]["user_id"],
+        cid=rows[0]["conversation_id"],
+        tg=rows[0]["test_group"],
+        si=[r["start_index"] for r in rows],
+        ei=[r["end_index"] for r in rows],
+        tc=[r["turn_count"] for r in rows],
+        txt=[r["text"] for r in rows],
+        fta=[r["first_turn_at"] for r in rows],
+        lta=[r["last_turn_at"] for r in rows],
+        th=[r["text_hash"] for r in rows],
     )
 
 
-def _log_event(user_id: str, test_group: int, event_name: str, data: Dict[str, Any]):
-    try:
-        db().run(
-            """
-            INSERT INTO analytics_events (user_id, test_group, event_name, data)
-            VALUES (:uid, :tg, :ev, :data)
-            """,
-            uid=user_id, tg=test_group, ev=event_name, data=data,
-        )
-    except Exception:
-        pass
-
-
-# ---------- LIVE CHAT support ----------
-def _next_turn_index(user_id: str, conversation_id: str) -> int:
+def _insert_windows_from_turns(
+    user_id: str,
+    conversation_id: str,
+    texts: List[str],
+    times: List[Any],
+    test_group: int,
+    min_len: int = 2,
+    max_len: int = 4,
+) -> int:
+    """
+    Server-side equivalent of build_windows + window_time_bounds + text_hash + insert:
+    turn texts/times go over the wire once as JSON arrays, Postgres builds every window
+    (string_agg with windowing.SEP), its time bounds and its SHA-256, and inserts them
+    in one statement. texts must already be normalized (extract_turn_texts), so the hash
+    matches windowing.text_hash. Returns the number of windows built.
+    """
+    # JSON rather than text[]: pg8000's array literals leave strings like "null" unquoted,
+    # which Postgres would read back as SQL NULL
+    sql = """
+    WITH
+    txt AS (
+      SELECT (ord - 1)::int AS i, t
+      FROM jsonb_array_elements_text(:txts::jsonb) WITH ORDINALITY AS u(t, ord)
+    ),
+    ts AS (
+      SELECT (ord - 1)::int AS i, ts::timestamptz AS ts
+      FROM jsonb_array_elements_text(:times::jsonb) WITH ORDINALITY AS u(ts, ord)
+    ),
+    spans AS (
+      SELECT s.i AS si, s.i + len - 1 AS ei
+      FROM txt s
+      CROSS JOIN generate_series(:minl::int, :maxl::int) AS len
+      WHERE s.i + len - 1 < jsonb_array_length(:txts::jsonb)
+    ),
+    win AS (
+      -- Expand each span to its turn positions (si + k) and hash-join on equality;
+      -- a range join (x.i BETWEEN si AND ei) would be a nested loop over spans x turns.
+      SELECT sp.si, sp.ei,
+             string_agg(x.t, :sep::text ORDER BY x.i) AS text,
+             MIN(ts.ts) AS first_turn_at,
+             MAX(ts.ts) AS last_turn_at
+      FROM spans sp
+      CROSS JOIN generate_series(0, :maxl::int - 1) AS k
+      JOIN txt x ON x.i = sp.si + k
+      LEFT JOIN ts ON ts.i = x.i
+      WHERE k <= sp.ei - sp.si
+      GROUP BY sp.si, sp.ei
+    ),
+    ins AS (
+      INSERT INTO conv_windows
+        (user_id, conversation_id, start_index, end_index, turn_count,
+         text, test_group, first_turn_at, last_turn_at, text_hash)
+      SELECT :uid, :cid, si, ei, ei - si + 1,
+             text, :tg::int, first_turn_at, last_turn_at,
+             encode(sha256(convert_to(text, 'UTF8')), 'hex')
+      FROM win
+      ON CONFLICT (user_id, conversation_id, start_index, end_index) DO NOTHING
+    )
+    SELECT count(*) FROM win;
+    """
     row = db().run(
-        "SELECT COALESCE(MAX(turn_index), -1) + 1 FROM conv_turns WHERE user_id=:u AND conversation_id=:c",
-        u=user_id, c=conversation_id,
+        sql,
+        uid=user_id, cid=conversation_id, tg=test_group,
+        txts=json.dumps(texts),
+        times=json.dumps([t.isoformat() if t is not None else None for t in times]),
+        minl=min_len, maxl=max_len, sep=SEP,
     )
     return int(row[0][0])
 
 
-def _insert_turn(user_id: str, conversation_id: str, role: str, content: str, turn_index: int):
+# Analytics is written off the request path: _log_event only enqueues, a daemon thread
+# flushes batches every EVENT_FLUSH_SECS (or as soon as EVENT_BATCH_MAX rows are waiting).
+EVENT_FLUSH_SECS = 0.1
+EVENT_BATCH_MAX = 200
+EVENT_STOP_TIMEOUT_SECS = 10.0
+_events: "queue.Queue[Tuple[str, int, str, str] | None]" = queue.Queue(maxsize=10_000)
+_event_writer: threading.Thread | None = None
+
+
+def _log_event(user_id: str, test_group: int, event_name: str, data: Dict[str, Any]):
+    try:
+        _events.put_nowait((user_id, test_group, event_name, json.dumps(data)))
+    except Exception:
+        pass  # queue full or unserializable payload: drop, analytics must never block a request
+
+
+def _insert_events(batch: List[Tuple[str, int, str, str]]):
+    # One JSON array of [user_id, test_group, event_name, data] rows (see _insert_windows_from_turns
+    # for why not text[]: an unquoted "null" user_id would become NULL and fail the whole batch)
     db().run(
         """
-        INSERT INTO conv_turns (user_id, conversation_id, turn_index, role, content)
-        VALUES (:u, :c, :i, :r, :t)
+        INSERT INTO analytics_events (user_id, test_group, event_name, data)
+        SELECT e->>0, (e->>1)::int, e->>2, (e->>3)::jsonb
+        FROM jsonb_array_elements(:rows::jsonb) AS e
         """,
-        u=user_id, c=conversation_id, i=turn_index, r=role, t=content
+        rows=json.dumps(batch),
     )
 
 
-def _recent_user_assistant_texts(user_id: str, conversation_id: str, last_n: int = 200) -> List[str]:
-    rows = db().run(
+def _drain_events():
+    """Writer loop; a None in the queue means flush what was read so far and exit."""
+    stop = False
+    while not stop:
+        first = _events.get()
+        if first is None:
+            break
+        batch = [first]
+        deadline = time.monotonic() + EVENT_FLUSH_SECS
+        while len(batch) < EVENT_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _events.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+        try:
+            _insert_events(batch)
+        except Exception:
+            pass
+
+
+def _start_event_writer():
+    global _event_writer
+    if _event_writer is None or not _event_writer.is_alive():
+        _event_writer = threading.Thread(target=_drain_events, name="analytics-writer", daemon=True)
+        _event_writer.start()
+
+
+def _stop_event_writer(timeout: float = EVENT_STOP_TIMEOUT_SECS):
+    """Queue the stop marker behind pending events and wait for the writer to flush them."""
+    global _event_writer
+    if _event_writer is None:
+        return
+    try:
+        _events.put(None, timeout=timeout)
+        _event_writer.join(timeout)
+    except queue.Full:
+        print("[main] Warning: analytics queue still full at shutdown; pending events dropped")
+    _event_writer = None
+
+
+# ---------- LIVE CHAT support ----------
+TAIL_MAX_LEN = 4  # longest live-chat window (turns); also how much of the tail is read / kept
+TURN_INSERT_DEADLINE_SECS = 2.0   # keep retrying turn_index collisions for up to this long
+TURN_INSERT_BACKOFF_SECS = 0.005  # base of the jittered exponential backoff between retries
+
+def _insert_turn(user_id: str, conversation_id: str, role: str, content: str) -> int:
+    """Append a turn, computing the next turn_index in the same statement; returns the index used."""
+    sql = """
+    INSERT INTO conv_turns (user_id, conversation_id, turn_index, role, content)
+    VALUES (:u, :c,
+            (SELECT COALESCE(MAX(turn_index), -1) + 1
+             FROM conv_turns WHERE user_id = :u AND conversation_id = :c),
+            :r, :t)
+    RETURNING turn_index
+    """
+    deadline = time.monotonic() + TURN_INSERT_DEADLINE_SECS
+    attempt = 0
+    user_ensured = False
+    while True:
+        try:
+            row = db().run(sql, u=user_id, c=conversation_id, r=role, t=content)
+            return int(row[0][0])
+        except Exception as e:
+            code = sqlstate(e)
+            if code == "23503" and not user_ensured:
+                _ensure_user(user_id, force=True)
+                user_ensured = True
+                continue
+            # 23505: a concurrent writer took the same index (uq_turn_idx); recompute and retry
+            if code != "23505" or time.monotonic() >= deadline:
+                raise
+        # Full-jitter exponential backoff so racing writers spread out instead of colliding again
+        attempt += 1
+        time.sleep(random.uniform(0, min(TURN_INSERT_BACKOFF_SECS * 2 ** attempt, 0.25)))
+
+
+def _recent_user_assistant_texts(
+    user_id: str, conversation_id: str, last_n: int = TAIL_MAX_LEN,
+) -> Tuple[List[int], List[str]]:
+    """
+    Return (turn_indices, texts) for the newest last_n non-blank user/assistant turns, oldest
+    first. Windows are keyed by the turns' turn_index (contiguous, see _insert_turn), so the
+    indices stay absolute without counting the whole conversation: the read is a backward
+    scan of uq_turn_idx that stops after last_n rows.
+    """
+    # One row back: (turn_index[], roles[], contents[]) for the tail, oldest first
+    row = db().run(
         """
-        SELECT role, content
-        FROM conv_turns
-        WHERE user_id=:u AND conversation_id=:c AND role IN ('user','assistant')
-        ORDER BY turn_index
+        SELECT array_agg(turn_index ORDER BY turn_index),
+               array_agg(role ORDER BY turn_index),
+               array_agg(content ORDER BY turn_index)
+        FROM (
+          SELECT turn_index, role, content
+          FROM conv_turns
+          WHERE user_id=:u AND conversation_id=:c AND role IN ('user','assistant')
+            AND content ~ '[^[:space:]]'
+          ORDER BY turn_index DESC
+          LIMIT :n
+        ) t
         """,
-        u=user_id, c=conversation_id,
-    )
-    turns = [{"role": r[0], "content": r[1]} for r in rows[-last_n:]]
-    return extract_turn_texts(turns)
-
-
-def _insert_tail_windows(user_id: str, conversation_id: str, texts: List[str], test_group: int):
-    for si, ei, joined in tail_windows_for_new_turn(texts, min_len=2, max_len=4):
-        db().run(
-            """
-            INSERT INTO conv_windows
-              (user_id, conversation_id, start_index, end_index, turn_count, text, test_group, text_hash)
-            VALUES
-              (:u, :c, :si, :ei, :tc, :txt, :tg, :th)
-            ON CONFLICT (user_id, conversation_id, start_index, end_index) DO NOTHING
-            """,
-            u=user_id, c=conversation_id, si=si, ei=ei, tc=(ei - si + 1),
-            txt=joined, tg=test_group, th=_sha256_norm(joined)
-        )
+        u=user_id, c=conversation_id, n=last_n,
+    )[0]
+    if row[0] is None:
+        return [], []
+    indices: List[int] = []
+    texts: List[str] = []
+    for i, r, c in zip(row[0], row[1], row[2]):
+        # per turn, so an index is only kept together with its (non-empty) normalized text
+        for t in extract_turn_texts([{"role": r, "content": c}]):
+            indices.append(int(i))
+            texts.append(t)
+    return indices, texts
+
+
+def _insert_tail_windows(
+    user_id: str, conversation_id: str, indices: List[int], texts: List[str], test_group: int,
+):
+    windows = tail_windows_for_new_turn(texts, min_len=2, max_len=TAIL_MAX_LEN)
+    rows = [
+        {
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "start_index": indices[si],
+            "end_index": indices[ei],
+            "turn_count": (ei - si + 1),
+            "text": joined,
+            "test_group": test_group,
+            "first_turn_at": None,
+            "last_turn_at": None,
+            "text_hash": th,
+        }
+        for (si, ei, joined), th in zip(windows, window_hashes(texts, windows))
+    ]
+    _insert_window_rows(rows)
 
 
 # ---------- routes ----------
@@ -232,25 +434,17 @@ def ingest(req: IngestRequest):
         raise HTTPException(status_code=400, detail="No user/assistant content to ingest.")
 
     times = extract_turn_times(turns_dicts)
-    windows = build_windows(texts, min_len=2, max_len=4)
-
-    inserted = 0
-    for (start_idx, end_idx, joined_text) in windows:
-        first_at, last_at = window_time_bounds(times, start_idx, end_idx)
-        row = {
-            "user_id": req.user_id,
-            "conversation_id": req.conversation_id,
-            "start_index": start_idx,
-            "end_index": end_idx,
-            "turn_count": (end_idx - start_idx + 1),
-            "text": joined_text,
-            "test_group": req.test_group,
-            "first_turn_at": first_at,
-            "last_turn_at": last_at,
-            "text_hash": _sha256_norm(joined_text),
-        }
-        _insert_window_row(row)
-        inserted += 1
+    try:
+        inserted = _insert_windows_from_turns(
+            req.user_id, req.conversation_id, texts, times, req.test_group, min_len=2, max_len=4,
+        )
+    except Exception as e:
+        if not _is_missing_user(e):
+            raise
+        _ensure_user(req.user_id, force=True)
+        inserted = _insert_windows_from_turns(
+            req.user_id, req.conversation_id, texts, times, req.test_group, min_len=2, max_len=4,
+        )
 
     _log_event(
         user_id=req.user_id,
@@ -264,11 +458,10 @@ def ingest(req: IngestRequest):
 @app.post("/ask", response_model=AskResponse)
 def ask(req: AskRequest):
     try:
-        q_vec = embed_text(req.question)
+        qvec_literal = embed_pgvector(req.question)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Embedding error: {e}")
 
-    qvec_literal = to_pgvector(q_vec)
     try:
         if req.hybrid:
             hits = retrieve_windows_hybrid(
@@ -294,53 +487,123 @@ def ask(req: AskRequest):
         data={"top_k": req.top_k, "hybrid": req.hybrid, "hits": [h.get("window_id") for h in hits]},
     )
 
-    norm_hits = _normalize_hits(hits)
-    return AskResponse(answer=answer, snippets=[Snippet(**h) for h in norm_hits])
+    # hits are already JSON-shaped (built by Postgres); skip re-validating them through Pydantic
+    return JSONResponse({"answer": answer, "snippets": hits})
 
 
 # ----- Live chat -----
-@app.post("/chat/send", response_model=AskResponse)
-def chat_send(
-    user_id: str = Body(...),
-    conversation_id: str = Body(...),
-    content: str = Body(...),
-    test_group: int = Body(1, embed=True),
-    hybrid: bool = Body(False, embed=True),
-):
+def _chat_prepare(
+    user_id: str, conversation_id: str, content: str, test_group: int, hybrid: bool,
+) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]], Tuple[List[int], List[str]]]:
+    """
+    Store the user's turn + its windows and build the chat messages (with RAG hits unless test_group 0).
+    Also returns the conversation tail (turn_indices, texts) for _chat_finish.
+    """
     _ensure_user(user_id)
 
     # 1) append user's turn
-    idx = _next_turn_index(user_id, conversation_id)
-    _insert_turn(user_id, conversation_id, "user", content, idx)
+    _insert_turn(user_id, conversation_id, "user", content)
 
     # 2) create windows ending at this user turn
-    texts = _recent_user_assistant_texts(user_id, conversation_id)
-    _insert_tail_windows(user_id, conversation_id, texts, test_group)
+    indices, texts = _recent_user_assistant_texts(user_id, conversation_id)
+    _insert_tail_windows(user_id, conversation_id, indices, texts, test_group)
 
-    # 3) answer (vector or hybrid RAG)
+    # 3) prompt (vector or hybrid RAG)
     if test_group == 0:
         messages = [
             {"role": "system", "content": "Be concise and helpful."},
             {"role": "user", "content": content},
         ]
-        answer = chat(messages)
-        hits: List[Dict[str, Any]] = []
+        return messages, [], (indices, texts)
+    qvec_literal = embed_pgvector(content)
+    if hybrid:
+        hits = retrieve_windows_hybrid(user_id=user_id, query_text=content, qvec=qvec_literal, top_k=6)
     else:
-        q_vec = embed_text(content)
-        qvec_literal = to_pgvector(q_vec)
-        if hybrid:
-            hits = retrieve_windows_hybrid(user_id=user_id, query_text=content, qvec=qvec_literal, top_k=6)
-        else:
-            hits = retrieve_windows_vector(user_id=user_id, qvec=qvec_literal, top_k=6)
-        messages = build_prompt(content, hits)
-        answer = chat(messages)
+        hits = retrieve_windows_vector(user_id=user_id, qvec=qvec_literal, top_k=6)
+    return build_prompt(content, hits), hits, (indices, texts)
 
-    # 4) append assistant reply + windowize again
-    idx2 = _next_turn_index(user_id, conversation_id)
-    _insert_turn(user_id, conversation_id, "assistant", answer, idx2)
-    texts2 = _recent_user_assistant_texts(user_id, conversation_id)
-    _insert_tail_windows(user_id, conversation_id, texts2, test_group)
 
-    # 5) return
-    norm_hits = _normalize_hits(hits)
-    return AskResponse(answer=answer, snippets=[Snippet(**h) for h in norm_hits])
+def _chat_finish(
+    user_id: str, conversation_id: str, answer: str, test_group: int, tail: Tuple[List[int], List[str]],
+) -> None:
+    """
+    Append the assistant reply + windowize again. The tail read in _chat_prepare is extended
+    with the reply in memory, so only the 1-3 windows ending at the new turn are built and
+    the conversation isn't re-read.
+    """
+    turn_index = _insert_turn(user_id, conversation_id, "assistant", answer)
+    new = extract_turn_texts([{"role": "assistant", "content": answer}])
+    if not new:
+        return  # blank reply: no new turn for windows to end at
+    indices, texts = tail
+    indices, texts = (indices + [turn_index])[-TAIL_MAX_LEN:], (texts + new)[-TAIL_MAX_LEN:]
+    _insert_tail_windows(user_id, conversation_id, indices, texts, test_group)
+
+
+def _sse(data: Any, event: str | None = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/send", response_model=AskResponse)
+def chat_send(
+    user_id: str = Body(...),
+    conversation_id: str = Body(...),
+    content: str = Body(...),
+    test_group: int = Body(1, embed=True),
+    hybrid: bool = Body(False, embed=True),
+):
+    messages, hits, tail = _chat_prepare(user_id, conversation_id, content, test_group, hybrid)
+    answer = chat(messages)
+    _chat_finish(user_id, conversation_id, answer, test_group, tail)
+
+    # hits are already JSON-shaped (built by Postgres); skip re-validating them through Pydantic
+    return JSONResponse({"answer": answer, "snippets": hits})
+
+
+@app.post("/chat/stream")
+def chat_send_stream(
+    user_id: str = Body(...),
+    conversation_id: str = Body(...),
+    content: str = Body(...),
+    test_group: int = Body(1, embed=True),
+    hybrid: bool = Body(False, embed=True),
+):
+    """
+    Same as /chat/send, but the reply is streamed as Server-Sent Events:
+      event: snippets  data: [hit, ...]            (once, before the first token)
+      data: "<token text>"                         (one per model delta)
+      event: done      data: {"answer": "<full>"}  (after the reply is stored)
+    """
+    messages, hits, tail = _chat_prepare(user_id, conversation_id, content, test_group, hybrid)
+
+    def events() -> Iterator[str]:
+        deltas = chat_stream(messages)
+        parts: List[str] = []
+        finished = False  # reply stored (or the model failed); set before writing so it's never stored twice
+        try:
+            yield _sse(hits, "snippets")
+            try:
+                for delta in deltas:
+                    parts.append(delta)
+                    yield _sse(delta)
+            except Exception as e:
+                finished = True
+                yield _sse({"detail": str(e)}, "error")
+                return
+            answer = "".join(parts).strip()
+            finished = True
+            _chat_finish(user_id, conversation_id, answer, test_group, tail)
+            yield _sse({"answer": answer}, "done")
+        finally:
+            deltas.close()  # also closes the upstream model stream (see rag_core.chat_stream)
+            if not finished:
+                # Client disconnected mid-reply (the generator is closed at a yield): store
+                # what was generated so far, like /chat/send always stores both turns
+                _chat_finish(user_id, conversation_id, "".join(parts).strip(), test_group, tail)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,39 @@
+# migrate_halfvec.py
+from __future__ import annotations
+from dotenv import load_dotenv
+from db import db
+
+# Load ..env file (DATABASE_URL must point to claradatabase)
+load_dotenv()
+
+# Convert conv_windows.embedding from vector(1536) (FP32) to halfvec(1536) (FP16) and rebuild
+# the HNSW index with halfvec ops. Run once, then set USE_HALFVEC=1 for the API and worker.
+# The index keeps its db.sql name so re-running init_schema.py leaves it alone.
+MIGRATION = """
+DROP INDEX IF EXISTS conv_windows_embedding_hnsw;
+ALTER TABLE conv_windows
+  ALTER COLUMN embedding TYPE halfvec(1536) USING embedding::halfvec(1536);
+SET maintenance_work_mem = '2GB';
+SET max_parallel_maintenance_workers = 7;
+CREATE INDEX IF NOT EXISTS conv_windows_embedding_hnsw
+  ON conv_windows USING hnsw (embedding halfvec_cosine_ops) WITH (m = 24, ef_construction = 128);
+RESET maintenance_work_mem;
+RESET max_parallel_maintenance_workers;
+ANALYZE conv_windows;
+"""
+
+def main():
+    conn = db()
+    row = conn.run(
+        "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+        "WHERE attrelid = 'conv_windows'::regclass AND attname = 'embedding'"
+    )
+    if row and row[0][0].startswith("halfvec"):
+        print("ℹ conv_windows.embedding is already halfvec.")
+        return
+
+    conn.run(MIGRATION)
+    print(" conv_windows.embedding migrated to halfvec(1536); set USE_HALFVEC=1")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
 # rag_core.py
 from __future__ import annotations
+import functools
+import io
 import os
 import re
 import random
-from typing import List, Dict, Any
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, Iterator, Sequence, Tuple
 
+import httpx
 from dotenv import load_dotenv
 from openai import OpenAI
 
 from db import db
+from windowing import text_hash
 
 # Load .env at import time so OPENAI_API_KEY / EMBED_MODEL / CHAT_MODEL are available
 load_dotenv()
@@ -17,31 +23,76 @@ load_dotenv()
 EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-small")  # 1536 dims
 CHAT_MODEL  = os.getenv("CHAT_MODEL",  "gpt-4o-mini")
 
-# Hybrid weights (tunable via .env)
+# Hybrid weights (tunable via .env), applied to each list's RRF term
 W_VECTOR = float(os.getenv("HYBRID_W_VECTOR", "0.7"))
 W_FTS    = float(os.getenv("HYBRID_W_FTS", "0.3"))
 
+# Store/search embeddings as halfvec (FP16): half the bytes per vector and per HNSW index page.
+# Requires running migrate_halfvec.py first; literals from to_pgvector parse as either type.
+USE_HALFVEC = os.getenv("USE_HALFVEC", "").lower() in ("1", "true", "yes")
+VEC_TYPE = "halfvec(1536)" if USE_HALFVEC else "vector"
+
 # Vector time decay (days), applies to both vector-only and hybrid scoring
 DECAY_DAYS = float(os.getenv("RAG_DECAY_DAYS", "45.0"))
 
 # Candidate sizes for late fusion (scan more than top_k to let the re-ranker work)
-VEC_CAND_MULT = int(os.getenv("HYBRID_VEC_CAND_MULT", "8"))   # vector candidates = top_k * this
+VEC_CAND_MULT = int(os.getenv("HYBRID_VEC_CAND_MULT", "8"))   # vector candidates = top_k * this (also vector-only)
 FTS_CAND_MULT = int(os.getenv("HYBRID_FTS_CAND_MULT", "8"))   # keyword candidates = top_k * this
 MIN_CANDS     = int(os.getenv("HYBRID_MIN_CANDS", "50"))      # floor for candidate set sizes
+RRF_K         = int(os.getenv("HYBRID_RRF_K", "60"))          # Reciprocal Rank Fusion damping constant
+
+# Cap on retrieved context sent to the chat model (approx. tokens, ~4 chars each)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", "2000"))
+
+# HNSW search breadth. pgvector's default ef_search=40 silently caps how many candidates an
+# index scan can return, so size it to the candidate LIMIT (pgvector accepts 1..1000).
+EF_SEARCH_MIN = int(os.getenv("HNSW_EF_SEARCH_MIN", "100"))
+
+
+# pgvector >= 0.8 iterative index scans: when the user_id filter discards most of what one
+# HNSW pass finds, keep scanning instead of silently returning fewer than LIMIT rows.
+# Older pgvector doesn't have the GUC; db.PooledConnection.apply_settings skips it there.
+HNSW_MAX_SCAN_TUPLES = int(os.getenv("HNSW_MAX_SCAN_TUPLES", "20000"))
+
+
+def _retrieval_settings(candidates: int, iterative_scan: str = "strict_order") -> Dict[str, Any]:
+    """Session GUCs for a retrieval query; hnsw.* only affect HNSW index scans, so they can stay set."""
+    ef = min(max(candidates * 2, EF_SEARCH_MIN), 1000)
+    return {
+        "hnsw.ef_search": ef,
+        "hnsw.iterative_scan": iterative_scan,
+        "hnsw.max_scan_tuples": HNSW_MAX_SCAN_TUPLES,
+    }
+
+
+# ---- OpenAI client (lazy, shared) ----
+# One pooled, kept-alive HTTP/2 connection pool per process: requests reuse TCP+TLS
+# instead of handshaking per call.
+OPENAI_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
 
 
-# ---- OpenAI client (lazy) ----
+@functools.lru_cache(maxsize=1)
 def _get_client() -> OpenAI:
     key = os.getenv("OPENAI_API_KEY")
     if not key:
         raise RuntimeError("OPENAI_API_KEY is not set")
-    return OpenAI(api_key=key)
+    http = httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+        timeout=OPENAI_HTTP_TIMEOUT,
+    )
+    return OpenAI(api_key=key, http_client=http)
 
 
 # ---- Lightweight intent guards (prevents needless retrieval + hallucinations) ----
+# Bare-word replies are plain set lookups; ACK_ONLY only handles run-together forms ("okthanks", "ok.ty").
+ACK_WORDS = frozenset({"ok", "okay", "thank", "thanks", "thank you", "thx", "ty"})
+ACK_CHARS = frozenset("👍👎👌🙏.")
+YES_WORDS = frozenset({"yes", "yeah", "yep", "yup", "correct", "right"})
+NO_WORDS = frozenset({"no", "nope"})
+GREETING_WORDS = frozenset({"hi", "hello", "hey", "hallo", "hola", "namaste"})
+
 ACK_ONLY = re.compile(r"^(ok(ay)?|thanks?|thank\s+you|thx|ty|👍+|👎+|👌+|🙏+|\.)+$", re.I)
-YESNO_ONLY = re.compile(r"^(yes|yeah|yep|yup|correct|right|no|nope)\.?$", re.I)
-GREETING_ONLY = re.compile(r"^(hi|hello|hey|hallo|hola|namaste)\b[!.]*$", re.I)
 
 # Fact statements like: "its dark blue cup", "it's green", "my bag is green",
 # "I am 68", "I'm Anna", "I like chess", "I have two cats"
@@ -58,19 +109,26 @@ NO_REPLIES  = ["Okay, no problem.", "Got it, thanks for telling me."]
 
 
 def is_acknowledgment(text: str) -> bool:
-    return bool(ACK_ONLY.match((text or "").strip()))
+    t = (text or "").strip().lower()
+    if not t:
+        return False
+    if t.strip(".") in ACK_WORDS or set(t) <= ACK_CHARS:
+        return True
+    return bool(ACK_ONLY.match(t))
 
 
 def is_yesno(text: str) -> str | None:
     """Return 'yes'/'no' if message is a bare yes/no; else None."""
     t = (text or "").strip().lower().strip(".")
-    if YESNO_ONLY.match(t):
-        return "no" if t in {"no", "nope"} else "yes"
+    if t in YES_WORDS:
+        return "yes"
+    if t in NO_WORDS:
+        return "no"
     return None
 
 
 def is_greeting(text: str) -> bool:
-    return bool(GREETING_ONLY.match((text or "").strip()))
+    return (text or "").strip().lower().rstrip("!.") in GREETING_WORDS
 
 
 def is_fact_statement(text: str) -> bool:
@@ -100,19 +158,142 @@ def confirm_fact(text: str) -> str:
 
 
 # ---- Helpers ----
-def to_pgvector(vec: List[float]) -> str:
-    """Format a Python list[float] into pgvector literal: [0.1,0.2,...]."""
-    return "[" + ",".join(f"{x:.6f}" for x in vec) + "]"
+@functools.lru_cache(maxsize=8)
+def _pgvector_template(dim: int) -> str:
+    """printf template for a dim-length pgvector literal, e.g. '[%.6f,%.6f]'."""
+    return "[" + ",".join(["%.6f"] * dim) + "]"
 
 
-def embed_text(text: str) -> List[float]:
-    """Get a single embedding vector."""
+def to_pgvector(vec: Sequence[float]) -> str:
+    """
+    Format a Python list[float] into pgvector literal: [0.1,0.2,...].
+    One C-level %-format call per vector instead of one f-string per element.
+    """
+    return _pgvector_template(len(vec)) % tuple(vec)
+
+
+def to_pgvectors(vecs: Iterable[Sequence[float]]) -> List[str]:
+    """Format a batch of vectors into pgvector literals."""
+    return [to_pgvector(v) for v in vecs]
+
+
+# In-process cache of query embeddings: (model, text_hash) -> (vector, pgvector literal).
+# Repeated/rephrased-to-identical chat questions skip both the OpenAI call and re-serialization.
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "1024"))
+_embed_cache: "OrderedDict[Tuple[str, str], Tuple[Tuple[float, ...], str]]" = OrderedDict()
+_embed_cache_lock = threading.Lock()
+
+
+EMBED_BATCH_MAX = 2048  # OpenAI limit on inputs per embeddings request
+
+
+def _cache_key(text: str) -> Tuple[str, str]:
+    return (EMBED_MODEL, text_hash(text))
+
+
+def _cache_get(key: Tuple[str, str]) -> Tuple[Tuple[float, ...], str] | None:
+    with _embed_cache_lock:
+        hit = _embed_cache.get(key)
+        if hit is not None:
+            _embed_cache.move_to_end(key)
+        return hit
+
+
+def _cache_put(key: Tuple[str, str], vec: Sequence[float]) -> Tuple[Tuple[float, ...], str]:
+    entry = (tuple(vec), to_pgvector(vec))
+    with _embed_cache_lock:
+        _embed_cache[key] = entry
+        _embed_cache.move_to_end(key)
+        if len(_embed_cache) > EMBED_CACHE_SIZE:
+            _embed_cache.popitem(last=False)
+    return entry
+
+
+def _cached_embedding(text: str) -> Tuple[Tuple[float, ...], str]:
+    key = _cache_key(text)
+    hit = _cache_get(key)
+    if hit is not None:
+        return hit
     client = _get_client()
     resp = client.embeddings.create(model=EMBED_MODEL, input=text)
-    return resp.data[0].embedding
+    return _cache_put(key, resp.data[0].embedding)
+
+
+def _cached_embeddings(texts: Sequence[str]) -> List[Tuple[Tuple[float, ...], str]]:
+    """
+    Batch form of _cached_embedding: cache hits are served locally and the misses
+    (deduplicated by normalized text) go out in as few embeddings requests as possible.
+    """
+    keys = [_cache_key(t) for t in texts]
+    entries: Dict[Tuple[str, str], Tuple[Tuple[float, ...], str]] = {}
+    misses: Dict[Tuple[str, str], str] = {}
+    for key, text in zip(keys, texts):
+        if key in entries or key in misses:
+            continue
+        hit = _cache_get(key)
+        if hit is not None:
+            entries[key] = hit
+        else:
+            misses[key] = text
+
+    if misses:
+        client = _get_client()
+        items = list(misses.items())
+        for i in range(0, len(items), EMBED_BATCH_MAX):
+            batch = items[i:i + EMBED_BATCH_MAX]
+            resp = client.embeddings.create(model=EMBED_MODEL, input=[t for _, t in batch])
+            # resp.data is in input order
+            for (key, _), d in zip(batch, resp.data):
+                entries[key] = _cache_put(key, d.embedding)
+
+    return [entries[k] for k in keys]
+
+
+def embed_text(text: str) -> List[float]:
+    """Get a single embedding vector (cached by normalized text)."""
+    return list(_cached_embedding(text)[0])
+
+
+def embed_texts(texts: Sequence[str]) -> List[List[float]]:
+    """Embedding vectors for several texts, in input order (cached; misses sent in one request)."""
+    return [list(vec) for vec, _ in _cached_embeddings(texts)]
+
+
+def embed_pgvector(text: str) -> str:
+    """Embedding of text as a pgvector literal, ready for :qv::vector / :qv::halfvec (cached by normalized text)."""
+    return _cached_embedding(text)[1]
 
 
 # ---- Retrieval (row-per-window) ----
+# Retrieval SQL is built once at import so every call sends byte-identical text and hits the
+# pooled connection's prepared-statement cache (db.PooledConnection) after the first call.
+# plan_cache_mode stays at auto: Postgres keeps custom plans while the generic one costs more.
+_VECTOR_SQL = f"""
+WITH s AS (
+  SELECT
+    window_id,
+    1 - (embedding <=> :qv::{VEC_TYPE}) AS sim,
+    EXTRACT(EPOCH FROM (now() - COALESCE(last_turn_at, created_at)))/86400.0 AS age_days
+  FROM conv_windows
+  WHERE user_id = :uid
+    AND embedding IS NOT NULL
+  ORDER BY (embedding <=> :qv::{VEC_TYPE}) ASC
+  LIMIT :vlim
+),
+top AS (
+  SELECT window_id, (sim * EXP(-GREATEST(age_days,0)/:decay))::float8 AS score
+  FROM s
+  ORDER BY score DESC
+  LIMIT :k
+)
+SELECT COALESCE(json_agg(json_build_object(
+         'window_id', t.window_id::text, 'conversation_id', w.conversation_id,
+         'text', w.text, 'score', t.score) ORDER BY t.score DESC), '[]'::json)
+FROM top t
+JOIN conv_windows w ON w.window_id = t.window_id;
+"""
+
+
 def retrieve_windows_vector(
     *,
     user_id: str,
@@ -123,30 +304,78 @@ def retrieve_windows_vector(
     """
     Vector-only retrieval from conv_windows for a given user.
     Score = cosine_sim * time_decay(age_days, decay_days).
+
+    The nearest candidates are taken by raw distance first (ORDER BY <=> ... LIMIT, which the
+    HNSW index can serve) and only those are re-ranked by the decayed score; ordering the
+    whole table by the decayed score would force a full scan + top-N sort.
     """
-    sql = """
-    WITH s AS (
-      SELECT
-        window_id,
-        conversation_id,
-        text,
-        1 - (embedding <=> :qv::vector) AS sim,
-        EXTRACT(EPOCH FROM (now() - COALESCE(last_turn_at, created_at)))/86400.0 AS age_days
-      FROM conv_windows
-      WHERE user_id = :uid
-        AND embedding IS NOT NULL
+    vec_lim = max(top_k * VEC_CAND_MULT, MIN_CANDS)
+
+    rows = db().run_with_settings(
+        _VECTOR_SQL, _retrieval_settings(vec_lim), qv=qvec, uid=user_id, decay=decay_days, vlim=vec_lim, k=top_k,
     )
-    SELECT window_id, conversation_id, text,
-           (sim * EXP(-GREATEST(age_days,0)/:decay)) AS score
-    FROM s
-    ORDER BY score DESC
-    LIMIT :k;
-    """
-    rows = db().run(sql, qv=qvec, uid=user_id, decay=decay_days, k=top_k)
-    return [
-        {"window_id": r[0], "conversation_id": r[1], "text": r[2], "score": float(r[3])}
-        for r in rows
-    ]
+    return rows[0][0]  # pg8000 decodes json -> list of hit dicts
+
+
+_HYBRID_SQL = f"""
+WITH
+vec AS (
+  SELECT window_id, ROW_NUMBER() OVER (ORDER BY dist) AS rnk
+  FROM (
+    SELECT window_id, embedding <=> :qv::{VEC_TYPE} AS dist
+    FROM conv_windows
+    WHERE user_id = :uid
+      AND embedding IS NOT NULL
+    ORDER BY (embedding <=> :qv::{VEC_TYPE}) ASC
+    LIMIT :vlim
+  ) v
+),
+q AS (
+  -- Parse the keyword query once; used as an InitPlan param by the GIN bitmap scan and ts_rank
+  SELECT websearch_to_tsquery('simple', :qtxt) AS tsq
+),
+fts AS (
+  SELECT window_id, ROW_NUMBER() OVER (ORDER BY fts_rank DESC) AS rnk
+  FROM (
+    SELECT window_id, ts_rank(fts, (SELECT tsq FROM q)) AS fts_rank
+    FROM conv_windows
+    WHERE user_id = :uid
+      AND fts @@ (SELECT tsq FROM q)
+    ORDER BY fts_rank DESC
+    LIMIT :flim
+  ) f
+),
+ranked AS (
+  -- One row per candidate window with its rank in each list (NULL = not in that list).
+  -- window_id is unique within each list, so a FULL JOIN merges them without aggregation.
+  SELECT COALESCE(v.window_id, f.window_id) AS window_id,
+         v.rnk AS vec_rnk,
+         f.rnk AS fts_rnk
+  FROM vec v
+  FULL JOIN fts f ON f.window_id = v.window_id
+),
+scored AS (
+  -- Only the timestamps are needed to score; text is fetched for the final top_k rows
+  SELECT
+    r.window_id,
+    (:vw * COALESCE(1.0 / (:rrfk + r.vec_rnk), 0) *
+       EXP(-GREATEST(EXTRACT(EPOCH FROM (now() - COALESCE(w.last_turn_at, w.created_at)))/86400.0, 0)/:decay)) +
+    (:fw * COALESCE(1.0 / (:rrfk + r.fts_rnk), 0)) AS hybrid_score
+  FROM ranked r
+  JOIN conv_windows w ON w.window_id = r.window_id
+),
+top AS (
+  SELECT window_id, hybrid_score::float8 AS score
+  FROM scored
+  ORDER BY hybrid_score DESC
+  LIMIT :k
+)
+SELECT COALESCE(json_agg(json_build_object(
+         'window_id', t.window_id::text, 'conversation_id', w.conversation_id,
+         'text', w.text, 'score', t.score) ORDER BY t.score DESC), '[]'::json)
+FROM top t
+JOIN conv_windows w ON w.window_id = t.window_id;
+"""
 
 
 def retrieve_windows_hybrid(
@@ -160,115 +389,29 @@ def retrieve_windows_hybrid(
     decay_days: float = DECAY_DAYS,
 ) -> List[Dict[str, Any]]:
     """
-    Hybrid retrieval = late fusion of:
-      - vector similarity (cosine) with time decay, and
+    Hybrid retrieval = Reciprocal Rank Fusion (RRF) of:
+      - vector similarity rank (cosine distance), and
       - keyword full-text rank (ts_rank on 'fts').
 
     Approach:
-      1) Pull top-N vector candidates and top-N FTS candidates (N >> top_k).
-      2) Union + dedupe on window_id.
-      3) Rescale both scores to ~[0,1] within the candidate set.
-      4) Combine: vec_weight * vscore + fts_weight * kscore.
-      5) Return top_k.
+      1) Pull top-N vector candidates and top-N FTS candidates (N >> top_k), each ranked 1..N.
+      2) FULL JOIN the two (window_id, rank) lists on window_id.
+      3) Score: vec_weight * 1/(K + vec_rank) * time_decay + fts_weight * 1/(K + fts_rank)
+         (a missing rank contributes 0). Rank-based, so no score normalization pass.
+      4) Return top_k; conversation_id/text are only read for those rows.
 
     Notes:
       - Uses 'simple' config to match your fts column creation.
       - websearch_to_tsquery handles quoted phrases, AND/OR, etc.
+      - Time decay applies to the vector part only (keeps the "freshness" effect).
     """
     vec_lim = max(top_k * VEC_CAND_MULT, MIN_CANDS)
     fts_lim = max(top_k * FTS_CAND_MULT, MIN_CANDS)
 
-    sql = """
-    WITH
-    vec AS (
-      SELECT
-        window_id,
-        conversation_id,
-        text,
-        1 - (embedding <=> :qv::vector) AS vec_sim,
-        EXTRACT(EPOCH FROM (now() - COALESCE(last_turn_at, created_at)))/86400.0 AS age_days
-      FROM conv_windows
-      WHERE user_id = :uid
-        AND embedding IS NOT NULL
-      ORDER BY (embedding <=> :qv::vector) ASC
-      LIMIT :vlim
-    ),
-    fts AS (
-      SELECT
-        window_id,
-        conversation_id,
-        text,
-        ts_rank(fts, websearch_to_tsquery('simple', :qtxt)) AS fts_rank
-      FROM conv_windows
-      WHERE user_id = :uid
-        AND fts @@ websearch_to_tsquery('simple', :qtxt)
-      ORDER BY fts_rank DESC
-      LIMIT :flim
-    ),
-    cand AS (
-      SELECT v.window_id,
-             v.conversation_id,
-             v.text,
-             v.vec_sim,
-             v.age_days,
-             0::float AS fts_rank
-      FROM vec v
-      UNION
-      SELECT f.window_id,
-             f.conversation_id,
-             f.text,
-             0::float AS vec_sim,
-             EXTRACT(EPOCH FROM (now() - COALESCE(NULLIF(NULL, NULL), now())))/86400.0 AS age_days_dummy, -- keep shape
-             f.fts_rank
-      FROM fts f
-    ),
-    merged AS (
-      -- Aggregate to combine vec/fts for the same window_id
-      SELECT
-        window_id,
-        ANY_VALUE(conversation_id) AS conversation_id,
-        ANY_VALUE(text)           AS text,
-        MAX(vec_sim)              AS vec_sim,
-        MAX(fts_rank)             AS fts_rank,
-        -- prefer a real age_days if present (0 if unknown)
-        MAX(age_days) FILTER (WHERE age_days IS NOT NULL) AS age_days
-      FROM cand
-      GROUP BY window_id
-    ),
-    scaled AS (
-      -- Normalize to ~[0,1] to make weights meaningful
-      SELECT
-        window_id,
-        conversation_id,
-        text,
-        CASE
-          WHEN MAX(vec_sim) OVER () > 0 THEN vec_sim / MAX(vec_sim) OVER ()
-          ELSE 0
-        END AS vscore_raw,
-        CASE
-          WHEN MAX(fts_rank) OVER () > 0 THEN fts_rank / MAX(fts_rank) OVER ()
-          ELSE 0
-        END AS kscore_raw,
-        COALESCE(age_days, 0) AS age_days
-      FROM merged
-    ),
-    scored AS (
-      SELECT
-        window_id,
-        conversation_id,
-        text,
-        -- Apply exponential time decay to the vector part only (keeps "freshness" effect)
-        (:vw * (vscore_raw * EXP(-GREATEST(age_days,0)/:decay))) +
-        (:fw * kscore_raw) AS hybrid_score
-      FROM scaled
-    )
-    SELECT window_id, conversation_id, text, hybrid_score
-    FROM scored
-    ORDER BY hybrid_score DESC
-    LIMIT :k;
-    """
-    rows = db().run(
-        sql,
+    rows = db().run_with_settings(
+        _HYBRID_SQL,
+        # RRF only needs each candidate's rank (re-sorted by ROW_NUMBER), so approximate order is fine
+        _retrieval_settings(vec_lim, iterative_scan="relaxed_order"),
         uid=user_id,
         qv=qvec,
         qtxt=query_text,
@@ -277,15 +420,39 @@ def retrieve_windows_hybrid(
         vw=vec_weight,
         fw=fts_weight,
         decay=decay_days,
+        rrfk=RRF_K,
         k=top_k,
     )
-    return [
-        {"window_id": r[0], "conversation_id": r[1], "text": r[2], "score": float(r[3])}
-        for r in rows
-    ]
+    return rows[0][0]  # pg8000 decodes json -> list of hit dicts
 
 
 # ---- Prompt + Chat ----
+def _build_context(snippets: List[Dict[str, Any]], budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Join snippet texts (best first) until ~budget tokens, skipping duplicates.
+    The top snippet is always kept so a long best match still reaches the model.
+    """
+    buf = io.StringIO()
+    seen = set()
+    used = 0
+    for s in snippets:
+        text = (s.get("text") or "").strip()
+        if not text:
+            continue
+        h = text_hash(text)
+        if h in seen:
+            continue
+        cost = len(text) // 4 + 1
+        if used and used + cost > budget:
+            break
+        seen.add(h)
+        if used:
+            buf.write("\n\n---\n\n")
+        buf.write(text)
+        used += cost
+    return buf.getvalue()
+
+
 def build_prompt(question: str, snippets: List[Dict[str, Any]]) -> List[Dict[str, str]]:
     """
     Supportive, memory-aware prompt designed for older adults.
@@ -293,7 +460,7 @@ def build_prompt(question: str, snippets: List[Dict[str, Any]]) -> List[Dict[str
     - If context is empty/insufficient: ask exactly ONE gentle follow-up and invite sharing so we can remember.
     - Keep replies short (1–3 short sentences), warm, and simple.
     """
-    context = "\n\n---\n\n".join(s["text"] for s in snippets).strip()
+    context = _build_context(snippets)
     has_context = bool(context)
 
     system = (
@@ -333,19 +500,39 @@ def build_prompt(question: str, snippets: List[Dict[str, Any]]) -> List[Dict[str
 
 
 
-def chat(messages: List[Dict[str, str]]) -> str:
-    """Call the chat model."""
-    client = _get_client()
-    resp = client.chat.completions.create(
+def _chat_params() -> Dict[str, Any]:
+    return dict(
         model=CHAT_MODEL,
         temperature=float(os.getenv("CHAT_TEMPERATURE", "0.2")),
         top_p=1,
         max_tokens=int(os.getenv("CHAT_MAX_TOKENS", "512")),
-        messages=messages,
     )
+
+
+def chat(messages: List[Dict[str, str]]) -> str:
+    """Call the chat model."""
+    client = _get_client()
+    resp = client.chat.completions.create(messages=messages, **_chat_params())
     return resp.choices[0].message.content.strip()
 
 
+def chat_stream(messages: List[Dict[str, str]]) -> Iterator[str]:
+    """
+    Call the chat model with stream=True and yield content deltas as they arrive.
+    Closing the generator early (e.g. the client went away) closes the HTTP stream too.
+    """
+    client = _get_client()
+    stream = client.chat.completions.create(messages=messages, stream=True, **_chat_params())
+    try:
+        for chunk in stream:
+            if chunk.choices:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+    finally:
+        stream.close()
+
+
 # ---- Public entrypoint for your pipeline ----
 def answer(user_id: str, query: str, mode: str = "hybrid") -> str:
     """
@@ -375,7 +562,7 @@ def answer(user_id: str, query: str, mode: str = "hybrid") -> str:
         return confirm_fact(q)
 
     # 5) Normal RAG flow
-    qvec = to_pgvector(embed_text(q))
+    qvec = embed_pgvector(q)
 
     if mode == "hybrid":
         snippets = retrieve_windows_hybrid(user_id=user_id, query_text=q, qvec=qvec, top_k=15)
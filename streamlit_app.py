@@ -1,13 +1,15 @@
 # frontend/chat_app.py  (you can keep the old file as backup if you want)
+import json
 import os
 import uuid
 import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
 
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 HEALTH_URL = f"{API_URL}/health"
 
-CHAT_SEND_URL   = f"{API_URL}/chat/send"
+CHAT_STREAM_URL = f"{API_URL}/chat/stream"
 CHAT_NEW_URL    = f"{API_URL}/chat/new"
 CHAT_RESET_URL  = f"{API_URL}/chat/reset"
 CONVS_URL       = f"{API_URL}/conversations"
@@ -17,13 +19,24 @@ st.set_page_config(page_title="RDS pgvector · Live Chat", page_icon="💬", lay
 st.title("💬 RDS pgvector · Live Chat (row-per-window RAG)")
 
 # ------------------- helpers -------------------
+def _http() -> requests.Session:
+    """Per-browser-session HTTP client: keep-alive connections to the backend survive reruns."""
+    s = st.session_state.get("http")
+    if s is None:
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
+        st.session_state["http"] = s
+    return s
+
 def _get_json(url: str, params=None, timeout=15):
-    r = requests.get(url, params=params or {}, timeout=timeout)
+    r = _http().get(url, params=params or {}, timeout=timeout)
     r.raise_for_status()
     return r.json()
 
 def _post_json(url: str, payload: dict, timeout=60):
-    r = requests.post(url, json=payload, timeout=timeout)
+    r = _http().post(url, json=payload, timeout=timeout)
     r.raise_for_status()
     return r.json()
 
@@ -41,13 +54,39 @@ def _load_history(user_id: str, conversation_id: str, limit: int = 500):
         st.error(f"Failed to load history: {e}")
         return []
 
-def _chat_send(user_id: str, conversation_id: str, content: str, test_group: int = 1):
-    return _post_json(CHAT_SEND_URL, {
+def _chat_stream(user_id: str, conversation_id: str, content: str, test_group: int, meta: dict):
+    """
+    Yield reply tokens from the SSE /chat/stream endpoint (for st.write_stream).
+    Retrieved snippets (sent before the first token) are stored in meta["snippets"].
+    """
+    payload = {
         "user_id": user_id,
         "conversation_id": conversation_id,
         "content": content,
         "test_group": test_group,  # 0 = no RAG, 1 = with RAG
-    }, timeout=120)
+    }
+    try:
+        with _http().post(CHAT_STREAM_URL, json=payload, stream=True, timeout=120) as r:
+            r.raise_for_status()
+            event = None
+            for line in r.iter_lines(decode_unicode=True):
+                if not line:
+                    event = None
+                    continue
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[5:])
+                    if event == "snippets":
+                        meta["snippets"] = data
+                    elif event == "error":
+                        meta["error"] = True
+                        yield f"⚠️ Error: {data.get('detail')}"
+                    elif event is None:
+                        yield data
+    except Exception as e:
+        meta["error"] = True
+        yield f"⚠️ Error: {e}"
 
 def _chat_new(user_id: str) -> str:
     try:
@@ -60,6 +99,27 @@ def _chat_new(user_id: str) -> str:
 def _chat_reset(user_id: str, conversation_id: str):
     return _post_json(CHAT_RESET_URL, {"user_id": user_id, "conversation_id": conversation_id})
 
+def _bump_conversation(cid: str, turns: int):
+    """Update the cached sidebar list for a sent message instead of re-fetching /conversations."""
+    convs = st.session_state.get("convs", [])
+    for k, c in enumerate(convs):
+        if c["conversation_id"] == cid:
+            c["turn_count"] += turns
+            convs.insert(0, convs.pop(k))  # most recent first, like the backend's ORDER BY last_at
+            return
+    st.session_state["_refresh_convs"] = True  # not listed yet: fetch on the next full run
+
+def _render_snippets(snippets):
+    with st.expander("🔎 Retrieved windows"):
+        for i, s in enumerate(snippets, 1):
+            score = s.get("score")
+            try:
+                score = f"{float(score):.3f}"
+            except Exception:
+                score = str(score)
+            st.markdown(f"**[{i}]** {s.get('conversation_id')} · `{s.get('window_id')}` · score={score}")
+            st.write(s.get("text", ""))
+
 # ------------------- sidebar -------------------
 with st.sidebar:
     st.header("Session")
@@ -81,7 +141,7 @@ with st.sidebar:
     with cols[1]:
         if st.button("🔎 Health", use_container_width=True):
             try:
-                st.json(requests.get(HEALTH_URL, timeout=10).json())
+                st.json(_http().get(HEALTH_URL, timeout=10).json())
             except Exception as e:
                 st.error(str(e))
 
@@ -142,51 +202,60 @@ st.caption(f"User: **{user_id}** · Conversation: **{cid}** · Test group: **{te
 
 # Load history from backend (source of truth)
 if st.session_state.get("_force_history_reload", True):
-    history = _load_history(user_id, cid, limit=500)
-    st.session_state["history"] = history
+    st.session_state["history"] = _load_history(user_id, cid, limit=500)
     st.session_state["_force_history_reload"] = False
-else:
+
+@st.fragment
+def _chat_area(user_id: str, cid: str, test_group: int):
+    """
+    Chat bubbles + input. The reply streams inside this fragment; the new turns are then
+    appended to the cached history and the sidebar's cached list is updated, so the full
+    rerun that redraws the sidebar costs no /chat/history or /conversations calls.
+    """
     history = st.session_state.get("history", [])
 
-# Render history (Streamlit's chat bubbles)
-for m in history:
-    role = m.get("role")
-    content = m.get("content", "")
-    if role in ("user", "assistant"):
-        with st.chat_message(role):
-            st.markdown(content)
-
-# Chat input
-msg = st.chat_input("Type a message…")
-if msg:
+    # Render history (Streamlit's chat bubbles)
+    for m in history:
+        role = m.get("role")
+        content = m.get("content", "")
+        if role in ("user", "assistant"):
+            with st.chat_message(role):
+                st.markdown(content)
+                if m.get("snippets"):
+                    _render_snippets(m["snippets"])
+
+    # Chat input
+    msg = st.chat_input("Type a message…")
+    if not msg:
+        return
+
     # optimistic render user's message
     with st.chat_message("user"):
         st.markdown(msg)
 
-    # send to backend
-    try:
-        resp = _chat_send(user_id, cid, msg, test_group=test_group)
-        answer = resp.get("answer", "")
-        snippets = resp.get("snippets", [])
-    except Exception as e:
-        answer = f"⚠️ Error: {e}"
-        snippets = []
-
-    # render assistant reply
+    # send to backend and render the assistant reply as tokens arrive
     with st.chat_message("assistant"):
-        st.markdown(answer)
+        meta = {}
+        answer = st.write_stream(_chat_stream(user_id, cid, msg, test_group, meta))
+        snippets = meta.get("snippets") or []
         if snippets:
-            with st.expander("🔎 Retrieved windows"):
-                for i, s in enumerate(snippets, 1):
-                    score = s.get("score")
-                    try:
-                        score = f"{float(score):.3f}"
-                    except Exception:
-                        score = str(score)
-                    st.markdown(f"**[{i}]** {s.get('conversation_id')} · `{s.get('window_id')}` · score={score}")
-                    st.write(s.get("text", ""))
-
-    # refresh history so the left pane counts & ordering stay correct
-    st.session_state["_force_history_reload"] = True
-    st.session_state["_refresh_convs"] = True
+            _render_snippets(snippets)
+
+    if meta.get("error"):
+        # the backend may have stored only part of the exchange; reload the truth next full run
+        st.session_state["_force_history_reload"] = True
+        st.session_state["_refresh_convs"] = True
+        return
+    history.extend([
+        {"role": "user", "content": msg},
+        {
+            "role": "assistant",
+            "content": answer if isinstance(answer, str) else "".join(map(str, answer)),
+            "snippets": snippets,  # local only: keeps the expander after the rerun
+        },
+    ])
+    _bump_conversation(cid, 2)
+    # Redraw the sidebar (turn count / order); everything it needs is already in session_state
     st.rerun()
+
+_chat_area(user_id, cid, test_group)